@@ -1,7 +1,9 @@
 from flask import Flask, request, jsonify
 import os
 import json
+import math
 from collections import defaultdict
+from bisect import bisect_right
 import re
 from flask_cors import CORS
 
@@ -139,78 +141,6 @@ def assign_positions(game_info, positions_by_count):
     return game_info
 
 
-def calculate_raise_frequencies(hands, positions_group, max_bb=40, min_bb=0, min_bet_bb=0, max_bet_bb=5, min_seat=7, max_seat=9):
-    frequencies = {}
-
-    for position, desired_positions in positions_group.items():
-        raise_opportunity_count = 0
-        raise_count = 0
-
-        for hand in hands:
-            players = hand.get('players')
-            if not players or len(players) < min_seat or len(players) > max_seat:
-                continue  # Skip hands that don't have player information or don't have 7 to 9 players
-
-            actions_preflop = hand.get('actions', {}).get('preflop', [])
-            big_blind_value = 0
-            for action in actions_preflop:
-                if 'posts big blind' in action:
-                    big_blind_value = int(action.split(
-                        '[')[-1].rstrip(']').replace(',', ''))
-                    break
-
-            if big_blind_value == 0:
-                continue  # Skip hands that don't have big blind information
-
-            for desired_position in desired_positions:
-                position_player = None
-                player_chips = 0
-                for player_info in players:
-                    if player_info.get('position') == desired_position:
-                        position_player = player_info['name']
-                        player_chips = player_info.get('chips', 0)
-                        break
-
-                stack_size_in_bb = player_chips / big_blind_value
-                if position_player is None or stack_size_in_bb > max_bb or stack_size_in_bb < min_bb:
-                    continue  # Skip if player at the desired position is not found or stack size is out of bounds
-
-                player_action_found = False
-                player_action = None
-                player_all_in = False
-                for action in actions_preflop:
-                    if f'Dealt to {position_player}' in action:
-                        player_action_found = True
-                        continue
-                    if player_action_found:
-                        if position_player in action:
-                            player_action = action
-                            if 'all-in' in action:
-                                player_all_in = True
-                            break
-
-                if player_action and not player_all_in:
-                    actions_before_player = actions_preflop[:actions_preflop.index(
-                        player_action)]
-                    if all(not 'calls' in action and not 'raises' in action and not 'all-in' in action for action in actions_before_player):
-                        raise_opportunity_count += 1
-
-                        if 'raises' in player_action:
-                            bet_size = int(player_action.split(
-                                '[')[-1].rstrip(']').replace(',', ''))
-                            bet_size_in_bb = bet_size / big_blind_value
-                            if min_bet_bb <= bet_size_in_bb <= max_bet_bb:
-                                raise_count += 1
-
-        raise_frequency = 0
-        if raise_opportunity_count > 0:
-            raise_frequency = (raise_count / raise_opportunity_count) * 100
-
-        frequencies[position] = raise_frequency
-
-    return json.dumps(frequencies)
-
-
 # def calculate_raise_frequencies_all_inn(hands, positions_group, max_bb=40, min_bb=0, min_bet_bb=0, max_bet_bb=5, min_seat=7, max_seat=9):
 #     frequencies = {}
 
@@ -290,154 +220,215 @@ def calculate_raise_frequencies(hands, positions_group, max_bb=40, min_bb=0, min
 #     return json.dumps(frequencies)
 
 
-def calculate_raise_frequencies_for_player(hands, positions_group, player_name, max_bb=40, min_bb=0, min_bet_bb=0, max_bet_bb=5, min_seat=7, max_seat=9):
-    frequencies = {}
-
-    for position, desired_positions in positions_group.items():
-        raise_opportunity_count = 0
-        allin_raise_count = 0
-
-        for hand in hands:
-            players = hand.get('players')
-            if not players or len(players) < min_seat or len(players) > max_seat:
-                continue  # Skip hands that don't have player information or don't have 7 to 9 players
-
-            actions_preflop = hand.get('actions', {}).get('preflop', [])
-            big_blind_value = 0
-            for action in actions_preflop:
-                if 'posts big blind' in action:
-                    big_blind_value = int(action.split(
-                        '[')[-1].rstrip(']').replace(',', ''))
-                    break
-
-            if big_blind_value == 0:
-                continue  # Skip hands that don't have big blind information
-
-            player_position = None
-            player_chips = 0
-            player_ante = 0
-            for player_info in players:
-                if player_info.get('name') == player_name:
-                    player_position = player_info.get('position')
-                    player_chips = player_info.get('chips', 0)
-                    for action in player_info.get('actions', {}).get('preflop', []):
-                        if 'posts ante' in action:
-                            player_ante = int(action.split(
-                                '[')[-1].rstrip(']').replace(',', ''))
-                            break
-                    break
-
-            if player_position not in desired_positions:
-                continue
-
-            stack_size_in_bb = (player_chips - player_ante) / big_blind_value
-            if stack_size_in_bb > max_bb or stack_size_in_bb < min_bb:
-                continue  # Skip if stack size is out of bounds
-
-            player_action_found = False
-            player_action = None
-            for action in actions_preflop:
-                if f'Dealt to {player_name}' in action:
-                    player_action_found = True
-                    continue
-                if player_action_found:
-                    if player_name in action:
-                        player_action = action
-                        break
-
-            if player_action:
-                actions_before_player = actions_preflop[:actions_preflop.index(
-                    player_action)]
-                if all(not 'calls' in action and not 'raises' in action for action in actions_before_player):
-                    raise_opportunity_count += 1
-
-                if 'raises' in player_action:
-                    bet_size = int(player_action.split(
-                        '[')[-1].rstrip(']').replace(',', ''))
-                    bet_size_in_bb = bet_size / big_blind_value
-                    if min_bet_bb <= bet_size_in_bb <= max_bet_bb and bet_size >= (player_chips - player_ante):
-                        allin_raise_count += 1
-
-        allin_raise_frequency = 0
-        if raise_opportunity_count > 0:
-            allin_raise_frequency = (
-                allin_raise_count / raise_opportunity_count) * 100
-
-        frequencies[position] = allin_raise_frequency
-
-    return json.dumps(frequencies)
+def big_blind_from_actions(actions_preflop):
+    for action in actions_preflop:
+        if 'posts big blind' in action:
+            return int(action.split('[')[-1].rstrip(']').replace(',', ''))
+    return 0
+
+
+def first_action_after_deal(actions_preflop, player_name):
+    player_action_found = False
+    for action in actions_preflop:
+        if f'Dealt to {player_name}' in action:
+            player_action_found = True
+            continue
+        if player_action_found and player_name in action:
+            return action
+    return None
+
+
+def locate_rfi_spot(hand, player_name, position_to_group):
+    actions_preflop = hand.get('actions', {}).get('preflop', [])
+    big_blind_value = big_blind_from_actions(actions_preflop)
+    if big_blind_value == 0:
+        return None  # Skip hands that don't have big blind information
+
+    for player_info in hand['players']:
+        group = position_to_group.get(player_info.get('position'))
+        if group is not None and player_info.get('name') == player_name:
+            stack_size_in_bb = player_info.get('chips', 0) / big_blind_value
+            return group, stack_size_in_bb, (actions_preflop, big_blind_value)
+    return None
+
+
+def resolve_rfi_action(spot, player_name):
+    actions_preflop, big_blind_value = spot
+    player_action = first_action_after_deal(actions_preflop, player_name)
+    if not player_action or 'all-in' in player_action:
+        return False, None
+
+    actions_before_player = actions_preflop[:actions_preflop.index(
+        player_action)]
+    if any('calls' in action or 'raises' in action or 'all-in' in action for action in actions_before_player):
+        return False, None
+
+    bet_size_in_bb = None
+    if 'raises' in player_action:
+        bet_size = int(player_action.split(
+            '[')[-1].rstrip(']').replace(',', ''))
+        bet_size_in_bb = bet_size / big_blind_value
+    return True, bet_size_in_bb
+
+
+def locate_allin_spot(hand, player_name, position_to_group):
+    actions_preflop = hand.get('actions', {}).get('preflop', [])
+    big_blind_value = big_blind_from_actions(actions_preflop)
+    if big_blind_value == 0:
+        return None  # Skip hands that don't have big blind information
+
+    for player_info in hand['players']:
+        if player_info.get('name') != player_name:
+            continue
+        group = position_to_group.get(player_info.get('position'))
+        if group is None:
+            return None
+        player_chips = player_info.get('chips', 0)
+        player_ante = 0
+        for action in player_info.get('actions', {}).get('preflop', []):
+            if 'posts ante' in action:
+                player_ante = int(action.split(
+                    '[')[-1].rstrip(']').replace(',', ''))
+                break
+        stack_size_in_bb = (player_chips - player_ante) / big_blind_value
+        return group, stack_size_in_bb, (actions_preflop, big_blind_value, player_chips - player_ante)
+    return None
+
+
+def resolve_allin_action(spot, player_name):
+    actions_preflop, big_blind_value, effective_stack = spot
+    player_action = first_action_after_deal(actions_preflop, player_name)
+    if not player_action:
+        return False, None
+
+    actions_before_player = actions_preflop[:actions_preflop.index(
+        player_action)]
+    opportunity = all(
+        not 'calls' in action and not 'raises' in action for action in actions_before_player)
+
+    # Raises are counted even without an open opportunity, as before
+    bet_size_in_bb = None
+    if 'raises' in player_action:
+        bet_size = int(player_action.split(
+            '[')[-1].rstrip(']').replace(',', ''))
+        if bet_size >= effective_stack:
+            bet_size_in_bb = bet_size / big_blind_value
+    return opportunity, bet_size_in_bb
+
+
+# (locate, resolve): locate returns (group, stack in BB, context) and resolve
+# gets that context back, only once the hand matched at least one bucket.
+# Each scan's context holds just what its own resolver unpacks.
+RFI_SCAN = (locate_rfi_spot, resolve_rfi_action)
+ALLIN_SCAN = (locate_allin_spot, resolve_allin_action)
+
+BUCKET_FIELDS = ('min_bb', 'max_bb', 'min_bet_bb',
+                 'max_bet_bb', 'min_seat', 'max_seat')
+
+
+def compile_bucket(key):
+    min_bb, max_bb, min_bet_bb, max_bet_bb, min_seat, max_seat = key
+    return {
+        'key': key,
+        'min_bb': min_bb,
+        'max_bb': max_bb,
+        'accepts_seats': lambda num_players: min_seat <= num_players <= max_seat,
+        'accepts_bet': lambda bet_size_in_bb: min_bet_bb <= bet_size_in_bb <= max_bet_bb,
+    }
 
 
-def calculate_raise_frequencies(hands, positions_group, player_name, max_bb=40, min_bb=0, min_bet_bb=0, max_bet_bb=5, min_seat=7, max_seat=9):
+def plan_params(params_list, player_name):
+    keys = []
+    rows = []
+    for params in params_list:
+        for param in params['value']:
+            values = [param.get(field) for field in BUCKET_FIELDS]
+            title = param.get('title')
+            if any(value is None for value in values + [title, player_name]):
+                return None, 'Missing one or more parameters'
+            try:
+                key = tuple(float(value) for value in values)
+            except (TypeError, ValueError):
+                return None, 'Invalid parameters format'
+            # NaN breaks the min_bb ordering the shared bisected scan relies on
+            if any(math.isnan(value) for value in key):
+                return None, 'Invalid parameters format'
+
+            keys.append(key)
+            rows.append({
+                'title': title,
+                'category': params['title'],
+                'title_eader': params['titleHeader'],
+                'table_title': params['table_title'],
+            })
+
+    # Identical buckets are scanned once, ordered by stack range for bisecting
+    ordered_keys = sorted(set(keys))
+    bucket_index = {key: i for i, key in enumerate(ordered_keys)}
+    plan = {
+        'buckets': [compile_bucket(key) for key in ordered_keys],
+        'rows': [(bucket_index[key], row) for key, row in zip(keys, rows)],
+    }
+    return plan, None
+
+
+def execute_plan(hands, plan, player_name, scan, position_to_group):
+    locate, resolve = scan
+    buckets = plan['buckets']
+    counts = [defaultdict(lambda: [0, 0]) for _ in buckets]
+    seat_plans = {}
+
+    for hand in hands:
+        players = hand.get('players')
+        if not players:
+            continue  # Skip hands that don't have player information
+
+        num_players = len(players)
+        seat_plan = seat_plans.get(num_players)
+        if seat_plan is None:
+            eligible = [i for i, bucket in enumerate(buckets)
+                        if bucket['accepts_seats'](num_players)]
+            seat_plan = ([buckets[i]['min_bb'] for i in eligible], eligible)
+            seat_plans[num_players] = seat_plan
+        min_bbs, eligible = seat_plan
+        if not eligible:
+            continue
+
+        spot = locate(hand, player_name, position_to_group)
+        if spot is None:
+            continue
+        group, stack_size_in_bb, context = spot
+
+        matched = [i for i in eligible[:bisect_right(min_bbs, stack_size_in_bb)]
+                   if stack_size_in_bb <= buckets[i]['max_bb']]
+        if not matched:
+            continue
+
+        opportunity, bet_size_in_bb = resolve(context, player_name)
+        for i in matched:
+            tally = counts[i][group]
+            if opportunity:
+                tally[0] += 1
+            if bet_size_in_bb is not None and buckets[i]['accepts_bet'](bet_size_in_bb):
+                tally[1] += 1
+
+    return counts
+
+
+def frequencies_from_counts(counts, positions_group):
     frequencies = {}
-
-    for position, desired_positions in positions_group.items():
-        raise_opportunity_count = 0
-        raise_count = 0
-
-        for hand in hands:
-            players = hand.get('players')
-            if not players or len(players) < min_seat or len(players) > max_seat:
-                continue  # Skip hands that don't have player information or don't have 7 to 9 players
-
-            actions_preflop = hand.get('actions', {}).get('preflop', [])
-            big_blind_value = 0
-            for action in actions_preflop:
-                if 'posts big blind' in action:
-                    big_blind_value = int(action.split(
-                        '[')[-1].rstrip(']').replace(',', ''))
-                    break
-
-            if big_blind_value == 0:
-                continue  # Skip hands that don't have big blind information
-
-            for desired_position in desired_positions:
-                position_player = None
-                player_chips = 0
-                for player_info in players:
-                    if player_info.get('position') == desired_position and player_info.get('name') == player_name:
-                        position_player = player_info['name']
-                        player_chips = player_info.get('chips', 0)
-                        break
-
-                stack_size_in_bb = player_chips / big_blind_value
-                if position_player is None or stack_size_in_bb > max_bb or stack_size_in_bb < min_bb:
-                    continue  # Skip if player at the desired position is not found or stack size is out of bounds
-
-                player_action_found = False
-                player_action = None
-                player_all_in = False
-                for action in actions_preflop:
-                    if f'Dealt to {position_player}' in action:
-                        player_action_found = True
-                        continue
-                    if player_action_found:
-                        if position_player in action:
-                            player_action = action
-                            if 'all-in' in action:
-                                player_all_in = True
-                            break
-
-                if player_action and not player_all_in:
-                    actions_before_player = actions_preflop[:actions_preflop.index(
-                        player_action)]
-                    if all(not 'calls' in action and not 'raises' in action and not 'all-in' in action for action in actions_before_player):
-                        raise_opportunity_count += 1
-
-                        if 'raises' in player_action:
-                            bet_size = int(player_action.split(
-                                '[')[-1].rstrip(']').replace(',', ''))
-                            bet_size_in_bb = bet_size / big_blind_value
-                            if min_bet_bb <= bet_size_in_bb <= max_bet_bb:
-                                raise_count += 1
-
+    for position in positions_group:
+        raise_opportunity_count, raise_count = counts.get(position, (0, 0))
         raise_frequency = 0
         if raise_opportunity_count > 0:
             raise_frequency = (raise_count / raise_opportunity_count) * 100
-
         frequencies[position] = raise_frequency
+    return frequencies
+
 
-    return json.dumps(frequencies)
+def build_position_lookup(positions_group):
+    return {position: group for group, desired_positions in positions_group.items()
+            for position in desired_positions}
 
 
 positions_by_count = {
@@ -453,67 +444,21 @@ positions_by_count = {
 }
 
 
-@app.route('/rfi_6_9', methods=['POST'])
-def upload_file():
-    if 'file' not in request.files:
-        return jsonify(error='No file part'), 400
-    file = request.files['file']
-    if file.filename == '':
-        return jsonify(error='No selected file'), 400
-
-    filename = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-    file.save(filename)
-
-    with open(filename, 'r', encoding="utf-8") as f:
-        text = f.read()
-
-    parsed_games = parse_hands(text, positions_by_count)
-
-    positions_group = {
-        'EP': ('UTG+1', 'UTG+2'),
-        'MP': ('MP+1', 'LJ'),
-        'HJ': ('HJ',),
-        'CO': ('CO',),
-        'BTN': ('BTN',),
-        'SB': ('SB',),
-        # 'BB': ('BB')
-    }
-
-    params = request.form.get('params')
-    player_name = request.form.get('player_name')
-    if not params:
-        return jsonify(error='No parameters provided'), 400
-    try:
-        params_list = json.loads(params)  # Теперь это список параметров
-    except json.JSONDecodeError:
-        return jsonify(error='Invalid parameters format'), 400
-
-    results = []
-    for params in params_list:  # Итерация по списку параметров
-        for param in params['value']:
-            max_bb = param.get('max_bb')
-            min_bb = param.get('min_bb')
-            min_bet_bb = param.get('min_bet_bb')
-            max_bet_bb = param.get('max_bet_bb')
-            min_seat = param.get('min_seat')
-            max_seat = param.get('max_seat')
-            title = param.get('title')
-
-            if any(param is None for param in [max_bb, min_bb, min_bet_bb, max_bet_bb, title, min_seat, max_seat, player_name]):
-                return jsonify(error='Missing one or more parameters'), 400
-
-            frequencies_json = calculate_raise_frequencies(
-                parsed_games, positions_group, player_name, max_bb, min_bb, min_bet_bb, max_bet_bb, min_seat, max_seat,
-            )
+positions_group = {
+    'EP': ('UTG+1', 'UTG+2'),
+    'MP': ('MP+1', 'LJ'),
+    'HJ': ('HJ',),
+    'CO': ('CO',),
+    'BTN': ('BTN',),
+    'SB': ('SB',),
+    # 'BB': ('BB')
+}
+position_to_group = build_position_lookup(positions_group)
 
-            result = json.loads(frequencies_json)
-            result['title'] = title
-            result['category'] = params['title']
-            result['title_eader'] = params['titleHeader']
-            result['table_title'] = params['table_title']
-            results.append(result)
 
-    return jsonify(data=results)
+@app.route('/rfi_6_9', methods=['POST'])
+def upload_file():
+    return process_upload(RFI_SCAN)
 
 
 @app.route('/')
@@ -584,7 +529,7 @@ def hello_world():
 #     return jsonify(data=results)
 
 
-def process_upload(calc_func):
+def process_upload(scan):
     if 'file' not in request.files:
         return jsonify(error='No file part'), 400
     file = request.files['file']
@@ -599,16 +544,6 @@ def process_upload(calc_func):
 
     parsed_games = parse_hands(text, positions_by_count)
 
-    positions_group = {
-        'EP': ('UTG+1', 'UTG+2'),
-        'MP': ('MP+1', 'LJ'),
-        'HJ': ('HJ',),
-        'CO': ('CO',),
-        'BTN': ('BTN',),
-        'SB': ('SB',),
-
-    }
-
     params = request.form.get('params')
     player_name = request.form.get('player_name')
     if not params:
@@ -618,37 +553,28 @@ def process_upload(calc_func):
     except json.JSONDecodeError:
         return jsonify(error='Invalid parameters format'), 400
 
-    results = []
-    for params in params_list:  # Итерация по списку параметров
-        for param in params['value']:
-            max_bb = param.get('max_bb')
-            min_bb = param.get('min_bb')
-            min_bet_bb = param.get('min_bet_bb')
-            max_bet_bb = param.get('max_bet_bb')
-            min_seat = param.get('min_seat')
-            max_seat = param.get('max_seat')
-            title = param.get('title')
-
-            if any(param is None for param in [max_bb, min_bb, min_bet_bb, max_bet_bb, title, min_seat, max_seat, player_name]):
-                return jsonify(error='Missing one or more parameters'), 400
+    plan, error = plan_params(params_list, player_name)
+    if error:
+        return jsonify(error=error), 400
 
-            frequencies_json = calc_func(
-                parsed_games, positions_group, player_name, max_bb, min_bb, min_bet_bb, max_bet_bb, min_seat, max_seat,
-            )
+    # One pass over the hands serves every bucket of the plan
+    counts = execute_plan(parsed_games, plan, player_name,
+                          scan, position_to_group)
+    frequencies = [frequencies_from_counts(bucket_counts, positions_group)
+                   for bucket_counts in counts]
 
-            result = json.loads(frequencies_json)
-            result['title'] = title
-            result['category'] = params['title']
-            result['title_eader'] = params['titleHeader']
-            result['table_title'] = params['table_title']
-            results.append(result)
+    results = []
+    for bucket_index, row in plan['rows']:
+        result = dict(frequencies[bucket_index])
+        result.update(row)
+        results.append(result)
 
     return jsonify(data=results)
 
 
 @app.route('/allin_6_9', methods=['POST'])
 def allInn():
-    return process_upload(calculate_raise_frequencies_for_player)
+    return process_upload(ALLIN_SCAN)
 
 
 if __name__ == '__main__':